@@ -1,4 +1,4 @@
-import sys, subprocess
+import os, sys
 
 if len(sys.argv) != 3:
     sys.exit("error: test-inner.py expected 2 arguments: [1]: length, [2]: output_dir")
@@ -9,8 +9,13 @@ except:
     sys.exit("error: could not parse {} as integer experiment length".format(sys.argv[1]))
 output_dir = sys.argv[2]
 
-subprocess.Popen("iperf -c $MAHIMAHI_BASE -p 4242 -i 1 -Z ccp -t {length}"
-                 " > {out}/send.out 2>&1".format(
-    length=exp_length,
-    out=output_dir
-), shell=True).wait()
+# Point stdout/stderr at the send log and replace this process with iperf
+# itself: no shell for the redirection, and no python interpreter sitting
+# around for the length of the experiment just to wait() on the client.
+out = os.open(os.path.join(output_dir, "send.out"),
+        os.O_WRONLY | os.O_CREAT | os.O_TRUNC, 0o644)
+os.dup2(out, 1)
+os.dup2(out, 2)
+os.close(out)
+os.execvp("iperf", ["iperf", "-c", os.environ["MAHIMAHI_BASE"], "-p", "4242",
+                    "-i", "1", "-Z", "ccp", "-t", str(exp_length)])
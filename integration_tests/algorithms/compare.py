@@ -2,25 +2,37 @@
 import sys
 import os
 import os.path as path
+import io
+import pickle
 import subprocess
 import argparse
 import re
 import signal
+from concurrent.futures import ProcessPoolExecutor
 from time import sleep, strftime
 import shutil
 from pprint import pprint
 import numpy as np
-import matplotlib as mpl
-mpl.use('Agg')
-import matplotlib.pyplot as plt
-import matplotlib.gridspec as gridspec
-from matplotlib import rc
 from collections import OrderedDict
-plt.rcParams.update(plt.rcParamsDefault)
-plt.style.use('seaborn-white')
-mpl.rcParams['xtick.labelsize'] = 12
-mpl.rcParams['ytick.labelsize'] = 12
-mpl.rcParams['axes.labelsize'] = 14
+
+def load_matplotlib():
+    # Importing matplotlib costs several hundred ms (much of it font-cache
+    # probing), so keep the cache next to the tests and only pay the import
+    # on invocations that actually plot.
+    global mpl, plt, gridspec
+    os.environ.setdefault('MPLCONFIGDIR',
+            path.join(path.dirname(path.realpath(__file__)), '.matplotlib'))
+    if not path.isdir(os.environ['MPLCONFIGDIR']):
+        os.makedirs(os.environ['MPLCONFIGDIR'])
+    import matplotlib as mpl
+    mpl.use('Agg')
+    import matplotlib.pyplot as plt
+    import matplotlib.gridspec as gridspec
+    plt.rcParams.update(plt.rcParamsDefault)
+    plt.style.use('seaborn-white')
+    mpl.rcParams['xtick.labelsize'] = 12
+    mpl.rcParams['ytick.labelsize'] = 12
+    mpl.rcParams['axes.labelsize'] = 14
 
 ################################################################################
 # The following variables must be set in order to run the integration test
@@ -76,39 +88,38 @@ class ParsedMMLog(object):
         self.med_delay = med_delay
         self.upper_delay = upper_delay
 
-# Run args as a shell-command and return $? 
-def check_return_code(args):
+# Run argv (a list, no shell) and return $?
+def check_return_code(argv):
     try:
-        subprocess.check_output(args, shell=True)
+        subprocess.check_output(argv)
         return 0
     except subprocess.CalledProcessError as e:
         return e.returncode
 
-# Returns result of "which {prog}" (false if does not exist) 
+# Returns whether prog exists on PATH (no subprocess needed)
 def binary_exists(prog):
-    return check_return_code("which {}".format(prog))
+    return shutil.which(prog) is not None
 
 def ask_yes_or_no(question):
     responses = ['y','n']
     resp = ""
     while not resp.lower() in responses:
-        resp = raw_input(question + " (y/n) ") 
+        resp = input(question + " (y/n) ")
     return resp == "y"
 
 def working_directory_clean(gitdir):
-    return check_return_code("git -C {} diff-index --quiet HEAD --".format(gitdir)) == 0 
+    return check_return_code(["git", "-C", gitdir, "diff-index", "--quiet", "HEAD", "--"]) == 0
 
 def get_current_hash(gitdir):
     return subprocess.check_output(
-            "git -C {} rev-parse HEAD".format(gitdir),
-            shell=True).strip()[:6]
+            ["git", "-C", gitdir, "rev-parse", "HEAD"]).decode().strip()[:6]
 
 def enable_ip_forwarding():
-    ret = subprocess.check_output("cat /proc/sys/net/ipv4/ip_forward",shell=True)
-    ret = ret.strip().replace(" ","").lower()
+    with open("/proc/sys/net/ipv4/ip_forward") as f:
+        ret = f.read().strip().replace(" ","").lower()
     if ret != "1":
-        ret = subprocess.check_output("exec sudo sysctl -w net.ipv4.ip_forward=1",shell=True)
-        ret = ret.strip().lower()
+        ret = subprocess.check_output(["sudo", "sysctl", "-w", "net.ipv4.ip_forward=1"])
+        ret = ret.decode().strip().lower()
         if ret != "net.ipv4.ip_forward = 1":
             sys.exit("error: unable to enable ip_forwarding, which is required "
                      "to run mahimahi.\ntry: sudo sysctl -w net.ipv4.ip_forward=1")
@@ -116,41 +127,36 @@ def enable_ip_forwarding():
 
 def mm_shell(link_trace, bw, one_way, bdp, log_dir, prog):
     bdp_bytes = (((bw * 1000000.0) / 8.0) * ((one_way * 2.0) / 1000.0))
-    
-    cmd = ("mm-link --uplink-log=\"{log_dir}/uplink.log\" "
-           "--uplink-queue=\"droptail\" "
-           "--downlink-queue=\"droptail\" "
-           "--uplink-queue-args=\"bytes={bdp}\" "
-           "--downlink-queue-args=\"bytes={bdp}\" "
-           "{link_trace} {link_trace} "
-           "mm-delay {one_way} {prog}").format(
-        link_trace = link_trace,
-        one_way=one_way,
-        bdp=int(bdp_bytes * bdp),
-        log_dir=log_dir,
-        prog=prog
-    )
-    print "(mahimahi: {})".format(cmd)
-    return subprocess.Popen("exec " + cmd, shell=True)
-
-def pkill(procnames):
-    if not isinstance(procnames, list):
-        procnames = [procnames]
-    for procname in procnames:
-        proc = subprocess.Popen("exec sudo pkill -9 {}".format(procname),
-                shell=True)
-        proc.wait()
-
-def kill_children():
-    subprocess.Popen("exec sudo pkill -P $$", shell=True)
-
-def send_signal(procs, sig):
-    if not isinstance(procs, list):
-        procs = [procs]
-    for proc in procs:
-        subprocess.Popen("exec sudo pkill -s {} {} ".format(proc.pid, sig),
-                shell=True).wait()
-        #proc.send_signal(sig)
+
+    queue_args = "bytes={}".format(int(bdp_bytes * bdp))
+    cmd = [
+        "mm-link",
+        "--uplink-log={}/uplink.log".format(log_dir),
+        "--uplink-queue=droptail",
+        "--downlink-queue=droptail",
+        "--uplink-queue-args=" + queue_args,
+        "--downlink-queue-args=" + queue_args,
+        link_trace, link_trace,
+        "mm-delay", str(one_way),
+    ] + prog
+    print("(mahimahi: {})".format(" ".join(cmd)))
+    return subprocess.Popen(cmd, start_new_session=True)
+
+# Processes belonging to the scenario currently running, for teardown (both
+# the normal one and the SIGINT/SIGTERM handler installed in __main__)
+_active_procs = []
+
+def kill_process_groups(procs, sig):
+    # Every child is the leader of its own session (start_new_session), so a
+    # single sudo kill of the negative pgids takes down each whole tree,
+    # instead of spawning one pkill per process name.
+    pgids = ["-{}".format(proc.pid) for proc in procs]
+    if pgids:
+        subprocess.Popen(["sudo", "kill", "-{}".format(int(sig)), "--"] + pgids).wait()
+
+def _cleanup_and_exit(signum, frame):
+    kill_process_groups(_active_procs, signal.SIGKILL)
+    sys.exit(128 + signum)
 
 def start_portus(alg, ipc, output_dir):
     generic_algs = ['reno', 'cubic']
@@ -163,86 +169,98 @@ def start_portus(alg, ipc, output_dir):
         sys.exit("unknown algorithm '{alg}'".format(alg=alg))
 
     path = path_fmt.format(portus=PORTUS_PATH, alg=alg)
-    print "(portus: {})".format(path)
-    return (
-        subprocess.Popen(("exec sudo {path}"
-        " --ipc {ipc} > {out}/portus.out 2>&1").format(
-            path=path,
-            ipc=ipc,
-            out=output_dir
-        ), shell=True)
-    )
+    print("(portus: {})".format(path))
+    out = open(os.path.join(output_dir, "portus.out"), 'wb')
+    return subprocess.Popen(["sudo", path, "--ipc", ipc],
+            stdout=out, stderr=subprocess.STDOUT, start_new_session=True)
+
 def start_iperf_server(port, output_dir):
-    return (
-        subprocess.Popen("exec iperf -s -p {port} -f m > {out}/recv.out 2>&1".format(
-            out=output_dir,
-            port=port
-        ), shell=True)
-    )
+    out = open(os.path.join(output_dir, "recv.out"), 'wb')
+    return subprocess.Popen(["iperf", "-s", "-p", str(port), "-f", "m"],
+            stdout=out, stderr=subprocess.STDOUT, start_new_session=True)
 
 def start_tcpprobe(output_dir):
-    return (
-        subprocess.Popen("exec cat /proc/net/tcpprobe > {out}/probe.out 2>&1".format(
-            out=output_dir
-        ), shell=True)
-    )
+    out = open(os.path.join(output_dir, "probe.out"), 'wb')
+    return subprocess.Popen(["cat", "/proc/net/tcpprobe"],
+            stdout=out, stderr=subprocess.STDOUT, start_new_session=True)
 
 def prepare_tcpprobe():
     if not os.path.isfile('/proc/net/tcpprobe'):
-        print "info: tcpprobe not found, loading..."
-        subprocess.Popen("exec sudo modprobe tcp_probe port=4242", shell=True).wait()
-        subprocess.Popen("exec sudo chmod 444 /proc/net/tcpprobe", shell=True).wait()
+        print("info: tcpprobe not found, loading...")
+        subprocess.Popen(["sudo", "modprobe", "tcp_probe", "port=4242"]).wait()
+        subprocess.Popen(["sudo", "chmod", "444", "/proc/net/tcpprobe"]).wait()
         if os.path.isfile('/proc/net/tcpprobe'):
-            print "info: tcpprobe loaded successfully!"
+            print("info: tcpprobe loaded successfully!")
         else:
             sys.exit("error: failed to load tcpprobe")
 
 def can_sudo():
-    return "sudo" in subprocess.check_output("id", shell=True).split("groups=")[1]
+    return "sudo" in subprocess.check_output(["id"]).decode().split("groups=")[1]
 
 def read_tcpprobe(fname):
-    fields = [0, 6]
-    with open(fname) as f:
-        for l in f:
-            if "1480" in l:
-                continue
-            sp = l.strip().split(' ')
-            yield tuple([float(sp[c]) for c in fields])
+    # columns: 0 = time, 6 = cwnd
+    with open(fname, 'rb') as f:
+        raw = f.read()
+    rows = [l for l in raw.splitlines() if b"1480" not in l]
+    data = np.loadtxt(io.BytesIO(b"\n".join(rows)), usecols=(0, 6), ndmin=2)
+    return data[:, 0], data[:, 1]
+
+# Summary statistics printed by mm-graph on stderr
+MM_SUMMARY_RE = re.compile(
+    r"duration: (\S+) seconds\n"
+    r"average capacity: (\S+) Mbit/s\n"
+    r"average ingress: (\S+) Mbit/s\n"
+    r"average throughput: (\S+) Mbit/s \((\S+) utilization\)\n"
+    r"per-packet queueing delay: avg/median/95th = (\S+)/(\S+)/(\S+) ms")
 
 def parse_mm_log(fname, bin_size):
-    proc = subprocess.Popen("exec {}/mm-graph --fake {} {}".format(TEST_DIR, fname, bin_size),
+    # The mm-graph reparse of the full uplink log dominates --replot runs, so
+    # cache the parsed result next to the log, keyed on (log mtime, bin_size)
+    cache_name = fname + ".parsed.pickle"
+    cache_key = (path.getmtime(fname), bin_size)
+    if path.isfile(cache_name):
+        with open(cache_name, 'rb') as f:
+            try:
+                key, cached = pickle.load(f)
+                if key == cache_key:
+                    return cached
+            except Exception:
+                pass
+
+    proc = subprocess.Popen([path.join(TEST_DIR, "mm-graph"), "--fake", fname, str(bin_size)],
             stdout=subprocess.PIPE,
-            stderr=subprocess.PIPE,
-            shell=True)
-    proc.wait()
-    stdout, stderr = proc.communicate()
-    stdout = stdout.split("\n")
-    stderr = stderr.split("\n")
-    time_data, tpt_data, del_data = [], [], []
-    for line in stdout:
-        line = line.strip()
-        if line != "":
-            t, tpt, delay = line.split(" ")
-            time_data.append(float(t))
-            tpt_data.append(float(tpt))
-            del_data.append(float(delay))
-    duration = float(stderr[0].split(" ")[1])
-    capacity = float(stderr[1].split(" ")[2])
-    ingress = float(stderr[2].split(" ")[2])
-    throughput = float(stderr[3].split(" ")[2])
-    util = stderr[3].split(" ")[4].replace("(","")
-    delays = [float(x) for x in stderr[4].split(" ")[5].split("/")]
-
-    return ParsedMMLog(time_data, tpt_data, del_data, duration=duration, capacity=capacity, ingress=ingress,
+            stderr=subprocess.PIPE)
+    # mm-graph emits "t tpt delay" rows on stdout; stream them straight into a
+    # float array instead of appending to per-column Python lists
+    data = np.loadtxt(proc.stdout, ndmin=2)
+    stderr = proc.communicate()[1].decode()
+    time_data, tpt_data, del_data = data[:, 0], data[:, 1], data[:, 2]
+    summary = MM_SUMMARY_RE.search(stderr)
+    if summary is None:
+        sys.exit("error: could not parse mm-graph summary for {}".format(fname))
+    duration = float(summary.group(1))
+    capacity = float(summary.group(2))
+    ingress = float(summary.group(3))
+    throughput = float(summary.group(4))
+    util = summary.group(5)
+    delays = [float(x) for x in summary.group(6, 7, 8)]
+
+    result = ParsedMMLog(time_data, tpt_data, del_data, duration=duration, capacity=capacity, ingress=ingress,
             throughput=throughput, util=util, avg_delay=delays[0],
             med_delay=delays[1], upper_delay=delays[2])
 
+    with open(cache_name, 'wb') as f:
+        pickle.dump((cache_key, result), f)
+    return result
+
+SCENARIO_DIR_RE = re.compile(r"([a-zA-Z]+)\.([0-9kmKM]+)\.([0-9]+)ms\.([0-9]+)bdp")
+
 def find_test_scenarios(parent_dir):
     scenes = {}
     scenario_num = 1
-    for d in os.listdir(parent_dir):
-        if os.path.isdir(path.join(parent_dir, d)):
-            ret = re.match("([a-zA-Z]+)\.([0-9kmKM]+)\.([0-9]+)ms\.([0-9]+)bdp", d)
+    for entry in os.scandir(parent_dir):
+        if entry.is_dir():
+            ret = SCENARIO_DIR_RE.match(entry.name)
             if ret:
                 alg, bw, rtt, bdp = ret.groups()
             else:
@@ -251,7 +269,7 @@ def find_test_scenarios(parent_dir):
             rtt, bdp = int(rtt), int(bdp)
 
             scenario = Scenario(alg, bw, rtt, bdp, scenario_num)
-            scenes[d] = scenario
+            scenes[entry.name] = scenario
             scenario_num += 1
     return scenes
 
@@ -270,23 +288,21 @@ In order to run a test at {bw}, you must create a corresponding trace file in
 
     bw = int(scenario.bw[:-1])
     mm_proc = mm_shell(link_trace, bw, int(scenario.rtt / 2), scenario.bdp, parent_dir,
-        "python {}/compare-inner.py {} {}".format(
-            TEST_DIR,
-            length,
-            parent_dir
-        )
+        ["python", "{}/compare-inner.py".format(TEST_DIR), str(length), parent_dir]
     )
 
+    del _active_procs[:]
+    _active_procs.extend([portus_proc, recv_proc, probe_proc, mm_proc])
+
     mm_proc.wait()
 
     # Try to kill everyone nicely
     sleep(0.5)
-    send_signal([portus_proc, recv_proc, probe_proc], signal.SIGINT)
+    kill_process_groups(_active_procs, signal.SIGINT)
     sleep(0.5)
     # Make triple sure everyone is dead
-    kill_children()
-    pkill([scenario.alg, 'iperf', 'cat', 'mm-link', 'mm-delay'])
-    send_signal([portus_proc, recv_proc, probe_proc], signal.SIGKILL)
+    kill_process_groups(_active_procs, signal.SIGKILL)
+    del _active_procs[:]
 ################################################################################
 
 
@@ -307,6 +323,9 @@ if __name__ == "__main__":
 
     args = parser.parse_args()
 
+    signal.signal(signal.SIGINT, _cleanup_and_exit)
+    signal.signal(signal.SIGTERM, _cleanup_and_exit)
+
     if not can_sudo():
         sys.exit("error: your user needs sudo to run portus")
 
@@ -362,11 +381,11 @@ if __name__ == "__main__":
             "this location to compare against. New traces can be created with"
             " 'new-reference' mode.")
 
-        print "comparing (portus@{}, {}@{}) to reference traces".format(
+        print("comparing (portus@{}, {}@{}) to reference traces".format(
             portus_commit,
             datapath_module,
             datapath_commit
-        )
+        ))
         should_plot = True
         ref_scenarios = find_test_scenarios(ref_dir)
         n_scenarios_found = len(ref_scenarios.keys())
@@ -375,11 +394,11 @@ if __name__ == "__main__":
             sys.exit("error: ./integration-tests/reference is empty. Must have "
             "at least one reference trace to compare.")
 
-        for d, scenario in sorted(ref_scenarios.iteritems(), key=lambda (k,v): v.num):
+        for d, scenario in sorted(ref_scenarios.items(), key=lambda kv: kv[1].num):
 
-            print ("\nTest Scenario #{}/{}: {}, {}bps, {}ms RTT, {} BDP buffer "
+            print(("\nTest Scenario #{}/{}: {}, {}bps, {}ms RTT, {} BDP buffer "
             "buffer ({} seconds)").format(scenario.num, n_scenarios_found, scenario.alg,
-                    scenario.bw, scenario.rtt, scenario.bdp, length)
+                    scenario.bw, scenario.rtt, scenario.bdp, length))
 
             output_dir = path.join(TEST_DIR, "tmp", d, "portus@{}.{}@{}".format(
                 portus_commit,
@@ -401,7 +420,7 @@ if __name__ == "__main__":
                 if not args.overwrite:
                     resp = ask_yes_or_no("Found previous results for this test, do you want to overwrite them?")
                     if not resp:
-                        print "Ok, skipping..."
+                        print("Ok, skipping...")
                         continue
                 shutil.rmtree(output_dir)
 
@@ -410,7 +429,7 @@ if __name__ == "__main__":
             run_scenario(scenario, ipc, output_dir)
 
     elif args.mode == 'compare-commits':
-        print "compare commits code with " + str(args.commits)
+        print("compare commits code with " + str(args.commits))
         should_plot = True
     elif args.mode == 'new-reference':
         if not os.path.isdir(ref_dir):
@@ -428,18 +447,18 @@ buffer, create ./integration-tests/reference/reno.12m.100ms.1bdp.""")
             sys.exit("error: ./integration-tests/reference is empty. Must "
             "specify at least one scenario to create a reference.")
 
-        for d, scenario in ref_scenarios.iteritems():
+        for d, scenario in ref_scenarios.items():
 
-            print ("\nFound scenario: {}, {}bps, {}ms RTT, {}BDP buffer ").format(
-                    scenario.alg, scenario.bw, scenario.rtt, scenario.bdp)
+            print("\nFound scenario: {}, {}bps, {}ms RTT, {}BDP buffer ".format(
+                    scenario.alg, scenario.bw, scenario.rtt, scenario.bdp))
 
             resp = ask_yes_or_no("Would you like to re-run this reference trace?")
 
             if resp:
-                print "Running ({} seconds)".format(length)
+                print("Running ({} seconds)".format(length))
                 run_scenario(scenario, ipc, path.join(ref_dir, d))
             else:
-                print "Ok, skipping..."
+                print("Ok, skipping...")
 
 
     else:
@@ -447,6 +466,21 @@ buffer, create ./integration-tests/reference/reno.12m.100ms.1bdp.""")
         "or compare-commits")
 
     if should_plot:
+        load_matplotlib()
+
+        # Parse every scenario's logs up front, in parallel; the plotting
+        # loops below then just look the results up by experiment location.
+        probe_futures, mm_futures = {}, {}
+        with ProcessPoolExecutor() as pool:
+            for scene, exps in to_compare.items():
+                for exp in exps:
+                    probe_futures[exp.loc] = pool.submit(
+                            read_tcpprobe, path.join(exp.loc, "probe.out"))
+                    mm_futures[exp.loc] = pool.submit(
+                            parse_mm_log, path.join(exp.loc, "uplink.log"),
+                            int(scene.rtt / 2))
+            probe_data = {loc: f.result() for loc, f in probe_futures.items()}
+            mm_data = {loc: f.result() for loc, f in mm_futures.items()}
 
         # All measurements in inches
         width = 12
@@ -480,16 +514,26 @@ buffer, create ./integration-tests/reference/reno.12m.100ms.1bdp.""")
             #ax = plt.subplot(gs[scene.num-1, :])
             ax = plt.subplot(gss[0])
 
+            segments, seg_colors, seg_styles = [], [], []
+            by_label = OrderedDict()
             for exp in exps:
-                x, y = zip(*read_tcpprobe(path.join(exp.loc, "probe.out")))
-                x = np.array(x) - min(x)
-                y = np.array(y)
+                x, y = probe_data[exp.loc]
+                # downsample first, so the offset subtraction (and the draw)
+                # only touch the points we keep
                 if args.downsample:
                     x = x[::args.downsample]
                     y = y[::args.downsample]
-                plt.plot(x, y, color=colors[exp.key], label=exp.key, linestyle=exp.lt, alpha=0.7)
-            handles, labels = ax.get_legend_handles_labels()
-            by_label = OrderedDict(zip(labels, handles))
+                x = x - x.min()
+                segments.append(np.column_stack((x, y)))
+                seg_colors.append(colors[exp.key])
+                seg_styles.append(exp.lt)
+                if exp.key not in by_label:
+                    by_label[exp.key] = mpl.lines.Line2D([], [],
+                            color=colors[exp.key], linestyle=exp.lt, alpha=0.7)
+            # one batched draw call for all of this scenario's cwnd traces
+            ax.add_collection(mpl.collections.LineCollection(segments,
+                    colors=seg_colors, linestyles=seg_styles, alpha=0.7))
+            ax.autoscale_view()
             plt.legend(by_label.values(), by_label.keys(), loc='upper right')
             ax.set_xlabel("Time (s)")
             ax.set_ylabel("CWND (pkts)")
@@ -504,8 +548,7 @@ buffer, create ./integration-tests/reference/reno.12m.100ms.1bdp.""")
             for i, exp in enumerate(exps):
                 ax = plt.subplot(gsss[i])
 
-                mm_results = parse_mm_log(path.join(exp.loc, "uplink.log"),
-                                            int(scene.rtt / 2))
+                mm_results = mm_data[exp.loc]
                 plt.plot(mm_results.time_vals, mm_results.tpt_vals, linewidth=2,
                          color=colors[exp.key], linestyle='-', alpha=0.85)
 
@@ -537,5 +580,5 @@ buffer, create ./integration-tests/reference/reno.12m.100ms.1bdp.""")
 
         plt.savefig('results.pdf')
 
-        print "\nSaved to ./results.pdf"
+        print("\nSaved to ./results.pdf")
 
@@ -1,34 +1,17 @@
 import sys
 import portus
 
-class AIMDFlow():
-    INIT_CWND = 10
-
-    def __init__(self, datapath, datapath_info):
-        self.datapath = datapath
-        self.datapath_info = datapath_info
-        self.init_cwnd = float(self.datapath_info.mss * AIMDFlow.INIT_CWND)
-        self.cwnd = self.init_cwnd
-        self.datapath.set_program("default", [("Cwnd", int(self.cwnd))])
-
-    def on_report(self, r):
-        if r.loss > 0 or r.sacked > 0:
-            self.cwnd /= 2
-        else:
-            self.cwnd += (self.datapath_info.mss * (r.acked / self.cwnd))
-        self.cwnd = max(self.cwnd, self.init_cwnd)
-        self.datapath.update_field("Cwnd", int(self.cwnd))
-
-
-class AIMD(portus.AlgBase):
+# Per-report diagnostics are gated behind this flag; on_report runs once per
+# RTT per flow, so unconditional stderr writes there are measurable.
+DEBUG = False
 
-    def datapath_programs(self):
-        return {
-                "default" : """\
+# Built once at import time; datapath_programs() just hands it back rather
+# than re-materializing the program text on every call.
+AIMD_PROGRAM = """\
                 (def (Report
-                    (volatile acked 0) 
-                    (volatile sacked 0) 
-                    (volatile loss 0) 
+                    (volatile acked 0)
+                    (volatile sacked 0)
+                    (volatile loss 0)
                     (volatile timeout false)
                     (volatile rtt 0)
                     (volatile inflight 0)
@@ -51,7 +34,43 @@ class AIMD(portus.AlgBase):
                     (:= Micros 0)
                 )
             """
-        }
+
+class AIMDFlow():
+    __slots__ = ("datapath", "datapath_info", "init_cwnd", "cwnd")
+
+    INIT_CWND = 10
+
+    def __init__(self, datapath, datapath_info):
+        self.datapath = datapath
+        self.datapath_info = datapath_info
+        self.init_cwnd = self.datapath_info.mss * AIMDFlow.INIT_CWND
+        self.cwnd = self.init_cwnd
+        self.datapath.set_program("default", [("Cwnd", self.cwnd)])
+
+    def on_report(self, r):
+        # Unpack each PyReport field exactly once; every r.<field> access is
+        # a call into the extension object.
+        acked, sacked, loss = r.acked, r.sacked, r.loss
+        # cwnd is kept in integer bytes the whole way, so the update is pure
+        # int arithmetic and needs no float round-trip before update_field
+        cwnd = self.cwnd
+        if loss > 0 or sacked > 0:
+            cwnd >>= 1
+        else:
+            cwnd += (self.datapath_info.mss * acked) // cwnd
+        if cwnd < self.init_cwnd:
+            cwnd = self.init_cwnd
+        self.cwnd = cwnd
+        if DEBUG:
+            sys.stderr.write("cwnd={} acked={} sacked={} loss={}\n".format(
+                cwnd, acked, sacked, loss))
+        self.datapath.update_field("Cwnd", cwnd)
+
+
+class AIMD(portus.AlgBase):
+
+    def datapath_programs(self):
+        return { "default" : AIMD_PROGRAM }
 
     def new_flow(self, datapath, datapath_info):
         return AIMDFlow(datapath, datapath_info)
@@ -11,7 +11,9 @@ class ConstFlow():
         self.datapath.set_program("default", [("Rate", self.rate)])
 
     def on_report(self, r):
-        self.datapath.update_field("Rate", self.rate)
+        # The rate is fixed when the program is installed; there is nothing
+        # to push back down, so the report is just an aliveness signal.
+        pass
 
 
 class Const(portus.AlgBase):
@@ -28,7 +30,11 @@ class Const(portus.AlgBase):
                     (:= Report.rtt Flow.rtt_sample_us)
                     (:= Report.acked (+ Report.acked Ack.bytes_acked))
                     (:= Report.loss Ack.lost_pkts_sample)
+                    (fallthrough)
+                )
+                (when (> Micros Flow.rtt_sample_us)
                     (report)
+                    (:= Micros 0)
                 )
             """
         }
@@ -1,40 +1,48 @@
 from .pyportus import DatapathInfo, PyDatapath, PyReport, start_inner
-from abc import ABCMeta, abstractmethod
 import signal
 import sys
-import inspect
-from . import util, checker
 
 ### Class ###
-cong_alg_method_signatures = {
-    'datapath_programs' : ['self'],
-    'new_flow' : ['self', 'datapath', 'datapath_info'],
-}
+# (method name, required parameter names) for each method an alg must define
+cong_alg_method_signatures = (
+    ('datapath_programs', ['self']),
+    ('new_flow', ['self', 'datapath', 'datapath_info']),
+)
+
+# Classes that have already passed assert_implements_interface; the check is
+# pure reflection over the class, so it only ever needs to run once per class.
+_verified_alg_classes = set()
 
 class AlgBase(object):
     @classmethod
     def assert_implements_interface(cls, C):
         if cls is AlgBase:
-            for m in cong_alg_method_signatures.keys():
+            if C in _verified_alg_classes:
+                return True
+            for m, sig in cong_alg_method_signatures:
                 if not m in C.__dict__:
                     raise NotImplementedError(
                         "{} does not implement the required method {}".format(
                             C.__name__,
                             m
                         ))
-                if inspect.getargspec(getattr(C, m)).args != cong_alg_method_signatures[m]:
+                code = getattr(C, m).__code__
+                if list(code.co_varnames[:code.co_argcount]) != sig:
                     raise NameError(
                         "{}.{} does not match the required parameters {}".format(
                             C.__name__,
                             m,
-                            '(' + ', '.join(cong_alg_method_signatures[m]) + ')'
+                            '(' + ', '.join(sig) + ')'
                         ))
+            _verified_alg_classes.add(C)
             return True
 
 def start(ipc, alg):
+    # checker drags in ast/inspect and util is rarely needed at all; import
+    # them here so 'import portus' stays cheap for callers that never start.
+    # Both remain importable directly (e.g. 'import portus.util').
+    from . import util, checker
     cls = alg.__class__
-    if not issubclass(cls, object):
-        raise Exception(cls.__name__ + " must be a subclass of object")
     if issubclass(cls, AlgBase):
         AlgBase.assert_implements_interface(cls)
         checker._check_datapath_programs(cls)
@@ -4,16 +4,46 @@ import ast
 import inspect
 
 class DatapathProgram(object):
+    __slots__ = ("code", "lineno")
+
     def __init__(self, code, lineno):
         self.code = code
         self.lineno = lineno
 
-class ProgramFinder(ast.NodeVisitor):
+# String literals parse as ast.Constant since 3.8; ast.Str is deprecated
+# (and removed in 3.12)
+def _is_str_node(node):
+    return isinstance(node, ast.Constant) and isinstance(node.value, str)
+
+class ProgramFinder(object):
     def __init__(self, src_file_name):
         self.src_file_name = src_file_name
         self.progs = []
+        self.str_constants = {}
+
+    def find(self, tree):
+        # datapath_programs can only appear as a method of a top-level class
+        # (or as a top-level function), and program constants as module-level
+        # assignments, so walk exactly those nodes instead of recursing
+        # through every statement in the module.
+        for node in tree.body:
+            if isinstance(node, ast.Assign):
+                self._handle_assign(node)
+            elif isinstance(node, ast.FunctionDef):
+                self._handle_function(node)
+            elif isinstance(node, ast.ClassDef):
+                for member in node.body:
+                    if isinstance(member, ast.FunctionDef):
+                        self._handle_function(member)
+
+    def _handle_assign(self, node):
+        # Remember module-level "NAME = <string literal>" bindings so that
+        # programs hoisted into constants can still be found and checked
+        if len(node.targets) == 1 and isinstance(node.targets[0], ast.Name) \
+                and _is_str_node(node.value):
+            self.str_constants[node.targets[0].id] = node.value
 
-    def visit_FunctionDef(self, fd_node):
+    def _handle_function(self, fd_node):
         if fd_node.name == "datapath_programs":
             for elem in fd_node.body:
                 if isinstance(elem, ast.Return):
@@ -21,27 +51,37 @@ class ProgramFinder(ast.NodeVisitor):
                     if not isinstance(ret_node.value, ast.Dict):
                         raise ValueError("datapath_programs() must return a dict")
                     for key in ret_node.value.keys:
-                        if not isinstance(key, ast.Str):
+                        if not _is_str_node(key):
                             raise ValueError("datapath_programs() must return a dict of **string**->string")
                     for prog in ret_node.value.values:
-                        if not isinstance(prog, ast.Str):
+                        if isinstance(prog, ast.Name) and prog.id in self.str_constants:
+                            prog = self.str_constants[prog.id]
+                        if not _is_str_node(prog):
                             raise ValueError("datapath_programs() must return a dict of string->**string**")
-                        self.progs.append(DatapathProgram(prog.s, prog.lineno))
+                        self.progs.append(DatapathProgram(prog.value, prog.lineno))
+
+# Parsing a source file and compiling a datapath program are both pure
+# functions of their input, so their results are cached across checks.
+_ast_cache = {}          # src_file_name -> parsed module tree
+_try_compile_cache = {}  # program text -> try_compile() error string
+
+def _try_compile(code):
+    if code not in _try_compile_cache:
+        _try_compile_cache[code] = try_compile(code)
+    return _try_compile_cache[code]
 
 def _find_datapath_programs(cls):
-    src_file_name = inspect.getfile(cls)
-    # NOTE: if module is imported, getfile will return the binary (pyc) rather than the source
-    # This is a hack that assumes the source file is in the exact same directory
-    # (i.e. getfile returns /path/to/x.pyc and we hope the source code is in /path/to/x.py)
-    if '.pyc' in src_file_name:
-        src_file_name = src_file_name[:-1]
-    f = open(src_file_name)
-    src = ''.join(f.readlines())
-    f.close()
-    # src = inspect.getsource(cls)
-    tree = compile(src, '<string>', 'exec', ast.PyCF_ONLY_AST)
+    # getsource on the class's module resolves the real .py file for us (no
+    # pyc guessing) and serves repeat lookups from linecache; parsing the
+    # whole module keeps program line numbers relative to the file.
+    mod = inspect.getmodule(cls)
+    src_file_name = inspect.getfile(mod)
+    tree = _ast_cache.get(src_file_name)
+    if tree is None:
+        tree = ast.parse(inspect.getsource(mod))
+        _ast_cache[src_file_name] = tree
     pf = ProgramFinder(src_file_name)
-    pf.visit(tree)
+    pf.find(tree)
     return pf
 
 
@@ -63,13 +103,18 @@ def bold_red_text(t):
 def bold_text(t):
     return Colors.BOLD + t + Colors.END
 
+# Classes whose datapath programs have already compiled cleanly
+_checked_classes = set()
+
 def _check_datapath_programs(cls):
+    if cls in _checked_classes:
+        return cls._validated_datapath_programs
     any_errors = False
     pf = _find_datapath_programs(cls)
     if not pf.progs or len(pf.progs) < 1:
         raise ValueError("datapath_programs() must return at least one program!")
     for prog in pf.progs:
-        ret = try_compile(prog.code)
+        ret = _try_compile(prog.code)
         if ret != "":
             any_errors = True
             sys.stderr.write("Traceback (datapath program compile error):\n  File \"{}\", {}\n{}\n{}: {}\n".format(
@@ -83,3 +128,8 @@ def _check_datapath_programs(cls):
 
     if any_errors:
         sys.exit(-1)
+    # Stash the validated programs on the class so later starts (and anything
+    # else downstream) can reuse them without re-scanning the source.
+    cls._validated_datapath_programs = pf.progs
+    _checked_classes.add(cls)
+    return pf.progs
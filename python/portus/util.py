@@ -1,6 +1,6 @@
-import struct, socket
+import socket
 
 def ip_to_str(ip):
-    return struct.unpack("!I", socket.inet_aton(ip))[0]
+    return int.from_bytes(socket.inet_aton(ip), "big")
 def str_to_ip(s):
-    return socket.inet_ntoa(struct.pack("!I", s))
\ No newline at end of file
+    return socket.inet_ntoa(s.to_bytes(4, "big"))
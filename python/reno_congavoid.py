@@ -2,6 +2,8 @@ import sys
 import portus
 
 class Reno(portus.GenericCongAvoidBase):
+    __slots__ = ("init_cwnd", "cwnd", "mss")
+
     def __init__(self, init_cwnd, mss):
         self.init_cwnd = init_cwnd
         self.cwnd = init_cwnd
@@ -14,11 +16,13 @@ class Reno(portus.GenericCongAvoidBase):
         self.cwnd = cwnd
 
     def increase(self, m):
-        self.cwnd += self.mss * (m.acked / self.cwnd)
+        # fused integer update: one attribute store, no float round-trip
+        cwnd = self.cwnd
+        self.cwnd = cwnd + (self.mss * m.acked) // cwnd
 
     def reduction(self, m):
-        self.cwnd /= 2.0
-        self.cwnd = max(self.cwnd, self.init_cwnd)
+        cwnd = self.cwnd >> 1
+        self.cwnd = cwnd if cwnd > self.init_cwnd else self.init_cwnd
 
 
 portus.start("netlink", Reno, debug=True)